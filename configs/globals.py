@@ -69,6 +69,26 @@ def init( ):
     global USE_DP
     USE_DP = False
     
+    # define the dtype the model parameters are compressed to while in transport. Only dtypes
+    # with a numpy equivalent are supported, i.e. "float32" (no compression) or "float16"
+    # (lossy, halves the payload, the returned losses are rounded as well)
+    global TRANSPORT_DTYPE
+    TRANSPORT_DTYPE = "float32"     # float32, float16
+    
+    # define the significance threshold (relative to each parameter's std) below which workers
+    # drop a parameter change and send their update as a sparse tensor. Indices cost 8 bytes
+    # each, so this only pays off when most of the parameters barely change.
+    global SPARSE_THRESHOLD
+    SPARSE_THRESHOLD = 0.0          # e.g. 1e-4, 0 to disable
+    
+    # whether to hand the model parameters to workers on the server's host through shared memory
+    global USE_SHM_PARAMS
+    USE_SHM_PARAMS = False
+    
+    # define the shared memory directory used for the above, the websocket is used if it doesn't exist
+    global SHM_PARAMS_DIR
+    SHM_PARAMS_DIR = "/dev/shm"
+    
     #-------------------------------------------------------------------------------------------#
     #                                                                                           #
     #   Define process related information to be used by the program.                           #
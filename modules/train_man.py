@@ -14,7 +14,8 @@ import numpy as np
 #   I M P O R T     L O C A L     L I B R A R I E S   /   F I L E S                             #
 #                                                                                               #
 #-----------------------------------------------------------------------------------------------#
-from utils.utils import model_flatten, model_unflatten, AverageMeter
+from utils.utils import model_flatten, model_unflatten, pack_params, pack_sparse_params, unpack_params
+from utils.utils import mask_insignificant_changes, AverageMeter
 from modules.optim_creator import get_optimizer
 
 #***********************************************************************************************#
@@ -76,10 +77,17 @@ class TrainingManager:
         """
         return self.owner.get_obj(self.plan_id)
 
+    def load_shared_params(self, path: str, dtype: str):
+        """Read the raw model parameters from shared memory and register them as the latest parameters
+        """
+        model_params = torch.from_numpy(np.fromfile(path, dtype=dtype))
+        model_params.id = self.model_param_id
+        self.owner.register_obj(model_params)
+
     def get_global_model(self):
         """Extract the latest model parameters stored at the federated worker
         """
-        model_params = self.owner.get_obj(self.model_param_id).clone().detach()
+        model_params = unpack_params(self.owner.get_obj(self.model_param_id))
         model = self.models[self.model_id]
         # unpack parameters into the locally stored model
         model_unflatten(model, model_params)
@@ -101,20 +109,24 @@ class TrainingManager:
     def store_training_results(self, updated_model, losses):
         """Store the training results as local objects
         """
-        # register losses array as a local object
-        loss = torch.tensor([1,2,3])#losses)
-        loss.id = self.result_losses_id #"loss"
-        self.owner.register_obj(loss)
+        # losses of all the batches trained on
+        loss = torch.stack(losses).detach()
         
         # register updated model as a local object
         updated_params = model_flatten(updated_model)
         updated_params.id = self.result_params_id #"updated_params"
         self.owner.register_obj(updated_params)
         
-        # compute change and register it for consumption by the server
-        difference = updated_params - (self.owner.get_obj(self.model_param_id))
-        difference.id = self.result_differ_id #"differnce"
-        self.owner.register_obj(difference)
+        # compute change and pack it with the losses, so the server fetches a single object
+        difference = updated_params - unpack_params(self.owner.get_obj(self.model_param_id))
+        if self.sparse_threshold > 0:
+            # only push the parameters that changed significantly
+            difference = mask_insignificant_changes(difference, updated_model, self.sparse_threshold)
+            result = pack_sparse_params(torch.cat([difference, loss]), dtype=self.transport_dtype)
+        else:
+            result = pack_params(torch.cat([difference, loss]), dtype=self.transport_dtype)
+        result.id = self.result_differ_id #"differnce"
+        self.owner.register_obj(result)
 
     def setup_configurations(self, config_dict: dict):
         """Setup the train configurations sent from the server
@@ -129,7 +141,8 @@ class TrainingManager:
         self.criterion = config_dict["criterion"]
         self.optimizer = config_dict["optimizer"]
         self.diff_privacy = config_dict["diff_privacy"]
-        self.result_losses_id = config_dict["result_losses_id"]
+        self.transport_dtype = getattr(torch, config_dict["transport_dtype"])
+        self.sparse_threshold = config_dict["sparse_threshold"]
         self.result_params_id = config_dict["result_params_id"]
         self.result_differ_id = config_dict["result_differ_id"]
     
@@ -7,6 +7,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import syft as sy
+from torch._utils import _unflatten_dense_tensors
 
 #-----------------------------------------------------------------------------------------------#
 #                                                                                               #
@@ -23,8 +24,12 @@ from configs import globals as glb
 #                                                                                               #
 #***********************************************************************************************#
 def set_model_params(module, params_list, start_param_idx=0):
-    """ Set params list into model recursively
+    """ Set params list into model recursively, params_list can either be a list of
+        tensors or a single flattened tensor as produced by model_flatten()
     """
+    if torch.is_tensor(params_list):
+        params_list = _unflatten_dense_tensors(params_list, list(module.parameters()))
+    
     param_idx = start_param_idx
 
     for name, param in module._parameters.items():
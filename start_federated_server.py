@@ -3,10 +3,20 @@
 #   I M P O R T     G L O B A L     L I B R A R I E S                                           #
 #                                                                                               #
 #-----------------------------------------------------------------------------------------------#
+import os
+import json
 import asyncio
+import functools
+try:
+    # use the faster libuv based event loop when it is available
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
 import websockets
 import argparse
-import time
+import concurrent.futures
+from types import MappingProxyType
 from timeit import default_timer as timer
 
 import torch
@@ -14,6 +24,7 @@ import torch.nn as nn
 import torchvision
 
 import syft as sy
+from syft.messaging.message import ObjectMessage
 # this hook is needed before the training_plan library import
 hook = sy.TorchHook(torch)
 
@@ -27,7 +38,7 @@ from modules.model_loader import get_model
 from modules.data_loader import load_dataset
 from modules.validate import validate
 #from modules.training_plan import build_and_get_train_plan
-from utils.utils import average_model_parameters, model_flatten, model_unflatten
+from utils.utils import model_flatten, model_unflatten, pack_params, unpack_params
 from configs import globals as glb
 
 #-----------------------------------------------------------------------------------------------#
@@ -36,6 +47,9 @@ from configs import globals as glb
 #                                                                                               #
 #-----------------------------------------------------------------------------------------------#
 WORKER_LIST = []
+WORKER_LIST_LOCK = asyncio.Lock()
+# pool used to run the blocking (de)serialization and socket calls off the event loop
+SERDE_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count())
     
 #***********************************************************************************************#
 #                                                                                               #
@@ -44,19 +58,21 @@ WORKER_LIST = []
 #                                                                                               #
 #***********************************************************************************************#
 async def connection_handler(websocket, path):
-    # receive information of the worker
-    worker_id = await websocket.recv()
-    worker_host = await websocket.recv()
-    worker_port = await websocket.recv()
+    # receive information of the worker in a single frame
+    worker_info = json.loads(await websocket.recv())
+    worker_id = worker_info["id"]
+    worker_host = worker_info["host"]
+    worker_port = worker_info["port"]
     # print log message
     print("connection received from client {0}!!!!".format(worker_id))
     # setup arguments
     kwargs_websocket = {"host": worker_host, "hook": hook, "verbose": True}
-    time.sleep(5)
+    await asyncio.sleep(5)
     # create new instance of the websocket server object
     remote_client_ptr = FederatedWorkerPointer(id=worker_id, port=int(worker_port), **kwargs_websocket)
     # update the local dictionary
-    WORKER_LIST.append([remote_client_ptr, worker_id, worker_host, int(worker_port)])
+    async with WORKER_LIST_LOCK:
+        WORKER_LIST.append([remote_client_ptr, worker_id, worker_host, int(worker_port)])
 
 #***********************************************************************************************#
 #                                                                                               #
@@ -64,11 +80,15 @@ async def connection_handler(websocket, path):
 #   helper fucntions to communicate with client worker.                                         #
 #                                                                                               #
 #***********************************************************************************************#
-async def fit_model_on_worker(worker_ptr: FederatedWorkerPointer, model_params, train_plan, dataset_key, iteration, sampled_id, kwargs):
+async def fit_model_on_worker(worker_ptr: FederatedWorkerPointer, params_future, shared_future, cleanup_future, param_count, train_plan, dataset_key, iteration, kwargs):
     """Send the model to the worker and fit the model on the worker's training data.
     Args:
         worker_ptr: Remote location, where the model shall be trained.
-        model: Batch size of each training step.
+        params_future: future resolving to the serialized message carrying the latest model parameters.
+        shared_future: future resolving to the shared memory file holding the latest model parameters,
+            or None if shared memory is not used.
+        cleanup_future: future of the remote clean up started after the previous iteration, or None.
+        param_count: number of elements in the flattened model parameters.
         train_plan: Model which shall be trained.
         iteration: current iteration being run
     Returns:
@@ -77,53 +97,117 @@ async def fit_model_on_worker(worker_ptr: FederatedWorkerPointer, model_params,
             * updated_parameter: parameters of the improved model.
             * loss: Loss on last training batch, torch.tensor.
     """
-    # clear all remote objects
-    worker_ptr.clear_objects_remote()
+    loop = asyncio.get_event_loop()
     
-    # setup sampled worker id to kwargs
-    kwargs["sampled_worker_id"] = sampled_id
+    # clear all remote objects, unless it is already done in the background since the previous
+    # iteration's results were fetched
+    if cleanup_future is None:
+        await loop.run_in_executor(SERDE_POOL, worker_ptr.clear_objects_remote)
+    else:
+        await cleanup_future
     
-    # send the fresh model parameters
-    model_params_copy = model_params.clone().detach()
-    model_params_copy.id = kwargs["model_param_id"]
-    ptr_model = model_params_copy.send(worker_ptr)
+    # set train configurations on the remote worker, this doesn't depend on the parameters
+    # so it overlaps with their serialization. The configuration doesn't change between
+    # iterations, so every worker receives it only once
+    if not worker_ptr.train_config_sent:
+        await loop.run_in_executor(SERDE_POOL, functools.partial(worker_ptr.set_train_config, **kwargs))
     
-    # set train configurations on the remote worker
-    await worker_ptr.set_train_config(**kwargs)
+    # send the fresh model parameters once they are ready, workers on this host read them
+    # directly from shared memory instead of receiving them over the websocket
+    if shared_future is not None and is_local_worker(worker_ptr):
+        shm_path = await shared_future
+        await loop.run_in_executor(SERDE_POOL, worker_ptr.load_shared_params, shm_path, kwargs["transport_dtype"])
+    else:
+        params_blob = await params_future
+        await loop.run_in_executor(SERDE_POOL, worker_ptr.send_bytes, params_blob)
     
     # run the async fit method and fetch results
-    task_object = worker_ptr.async_fit(dataset_key=dataset_key, iteration=iteration, return_ids=[kwargs["result_losses_id"], kwargs["result_differ_id"]])
-    loss, worker_update = await task_object
+    task_object = worker_ptr.async_fit(dataset_key=dataset_key, iteration=iteration, return_ids=[kwargs["result_differ_id"]], executor=SERDE_POOL)
+    result = await task_object
+    
+    # unpack the parameter change and the losses from the single result
+    result = unpack_params(result)
+    worker_update, loss = result[:param_count], result[param_count:]
     
     # return results    
     return worker_ptr.id, loss, worker_update
 
+#***********************************************************************************************#
+#                                                                                               #
+#   description:                                                                                #
+#   helper fucntion to serialize the model parameters once for all the workers.                 #
+#                                                                                               #
+#***********************************************************************************************#
+def serialize_model_params(model_params, param_id, dtype=torch.float32):
+    """Serialize the model parameters into an object message that can be reused for every worker.
+    Args:
+        model_params: flattened parameters of the global model.
+        param_id: id under which the parameters are registered on the workers.
+        dtype: dtype the parameters are compressed to for transport.
+    Returns:
+        bytes: the serialized object message.
+    """
+    # a view would drag its whole underlying storage onto the wire, so ship a dense copy
+    model_params_copy = pack_params(model_params, dtype=dtype)
+    assert model_params_copy.storage().size() == model_params_copy.numel()
+    model_params_copy.id = param_id
+    return sy.serde.serialize(ObjectMessage(model_params_copy))
+
+#***********************************************************************************************#
+#                                                                                               #
+#   description:                                                                                #
+#   helper fucntions to share the model parameters with workers running on the same host.       #
+#                                                                                               #
+#***********************************************************************************************#
+def is_local_worker(worker_ptr: FederatedWorkerPointer):
+    """Check whether the worker runs on the same host as the server.
+    """
+    return worker_ptr.host in ("127.0.0.1", "localhost")
+
+def write_shared_params(model_params, path, dtype=torch.float32):
+    """Write the raw model parameters into shared memory, bypassing serialization.
+    Args:
+        model_params: flattened parameters of the global model.
+        path: file in shared memory (e.g. under /dev/shm) to write the parameters to.
+        dtype: dtype the parameters are compressed to for transport.
+    Returns:
+        str: the path the parameters were written to.
+    """
+    # write to a temporary file first so that a worker never reads a half written file
+    tmp_path = path + ".tmp"
+    pack_params(model_params, dtype=dtype).numpy().tofile(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
 #***********************************************************************************************#
 #                                                                                               #
 #   description:                                                                                #
 #   helper fucntions to build arguments dictionary for training configurations.                 #
 #                                                                                               #
 #***********************************************************************************************#
-def build_training_configurations():
-    # create an arguments dictionary
-    kwargs = dict()
-    kwargs["plan_id"] = glb.PLAN_ID
-    kwargs["model_id"] = glb.MODEL
-    kwargs["model_param_id"] = glb.MODEL_PARAM_ID
-    kwargs["lr"] = glb.INITIAL_LR
-    kwargs["batch_size"] = glb.BATCH_SIZE
-    kwargs["random_sample"] = glb.RANDOM_SAMPLE_BATCHES
-    kwargs["max_nr_batches"] = glb.MAX_NR_BATCHES
-    kwargs["dataset_key"] = glb.DATASET_ID
-    #kwargs["iterations"] = glb.NUM_ITERS
-    kwargs["criterion"] = glb.CRITERION
-    kwargs["optimizer"] = glb.OPTIMIZER
-    kwargs["diff_privacy"] = glb.USE_DP
-    kwargs["result_params_id"] = "result_param"
-    kwargs["result_differ_id"] = "result_diff"
-    kwargs["result_losses_id"] = "result_loss"
+# the training configuration only depends on the global settings, so it is built once and
+# kept read only. It must not hold any per iteration values as every worker receives it only once
+TRAIN_CONFIG = MappingProxyType({
+    "plan_id": glb.PLAN_ID,
+    "model_id": glb.MODEL,
+    "model_param_id": glb.MODEL_PARAM_ID,
+    "lr": glb.INITIAL_LR,
+    "batch_size": glb.BATCH_SIZE,
+    "random_sample": glb.RANDOM_SAMPLE_BATCHES,
+    "max_nr_batches": glb.MAX_NR_BATCHES,
+    "dataset_key": glb.DATASET_ID,
+    #"iterations": glb.NUM_ITERS,
+    "criterion": glb.CRITERION,
+    "optimizer": glb.OPTIMIZER,
+    "diff_privacy": glb.USE_DP,
+    "transport_dtype": glb.TRANSPORT_DTYPE,
+    "sparse_threshold": glb.SPARSE_THRESHOLD,
+    "result_params_id": "result_param",
+    "result_differ_id": "result_diff",
+})
 
-    return kwargs
+def build_training_configurations():
+    return TRAIN_CONFIG
 
 #***********************************************************************************************#
 #                                                                                               #
@@ -145,6 +229,13 @@ async def training_handler():
     # build model
     model = get_model(model_name=glb.MODEL)
     
+    # separate model instance that the validation runs on while the next iteration trains
+    val_model = get_model(model_name=glb.MODEL)
+    val_future = None
+    
+    # remote clean ups started as soon as a worker returned its results, keyed by worker id
+    pending_cleanup = dict()
+    
     # get a loss function
     criterion = nn.CrossEntropyLoss()
     
@@ -154,6 +245,21 @@ async def training_handler():
     # get some variable
     n_iterations = glb.NUM_ITERS
     
+    loop = asyncio.get_event_loop()
+    
+    # flatten the model once, this buffer is the master copy of the parameters and is
+    # updated in place with the averaged updates every iteration
+    model_params = model_flatten(model)
+    
+    # shared memory file, unique to this server, used to hand the parameters to workers on this
+    # host. Every worker receives them over the websocket if it's disabled or not supported
+    shm_path = None
+    if glb.USE_SHM_PARAMS:
+        if os.path.isdir(glb.SHM_PARAMS_DIR):
+            shm_path = os.path.join(glb.SHM_PARAMS_DIR, "async_pysyft_model_params_{0}".format(os.getpid()))
+        else:
+            print("Shared memory directory {0} not found, sending parameters over websockets".format(glb.SHM_PARAMS_DIR))
+    
     start = timer()
     print(f"\nStarting the Training Process for {n_iterations} iterations\n")
     # iterate over the workers
@@ -161,53 +267,90 @@ async def training_handler():
         # print log message
         print("\n\nRunning iteration {0} of {1}".format(curr_iter+1, n_iterations))
             
-        # sample workers based on our logic here
-        sampled_workers = [worker[0] for worker in WORKER_LIST] #[WORKER_LIST[0][0]]
+        # sample workers based on our logic here, waiting for workers to connect if there are
+        # none yet so that every counted iteration actually trains
+        while True:
+            async with WORKER_LIST_LOCK:
+                sampled_workers = [worker[0] for worker in WORKER_LIST] #[WORKER_LIST[0][0]]
+            if len(sampled_workers) > 0:
+                break
+            print("No workers connected, waiting before iteration {0}".format(curr_iter+1))
+            await asyncio.sleep(5)
+        workers_by_id = {worker.id: worker for worker in sampled_workers}
         print("Sampled worker count: ", len(sampled_workers))
         
-        # extract latest model parameters
-        model_params = model_flatten(model)
-        
         # run the training on all workers
         start_timer_iter = timer()
-        results = await asyncio.gather(
-            *[
-                fit_model_on_worker(
-                    worker_ptr=worker,
-                    model_params=model_params,
-                    train_plan=train_plan,
-                    dataset_key=glb.DATASET_ID,
-                    iteration=curr_iter,
-                    sampled_id=idx,
-                    kwargs=kwargs,
-                )
-                for idx, worker in enumerate(sampled_workers)
-            ])
+        
+        # serialize the parameters only once, the same payload goes to every remote worker while
+        # the local workers share a single copy in shared memory. These are not awaited here so
+        # that the workers can be prepared while the serialization runs
+        transport_dtype = getattr(torch, kwargs["transport_dtype"])
+        params_future, shared_future = None, None
+        local_workers = [worker for worker in sampled_workers if shm_path is not None and is_local_worker(worker)]
+        if len(local_workers) < len(sampled_workers):
+            params_future = loop.run_in_executor(SERDE_POOL, serialize_model_params, model_params, kwargs["model_param_id"], transport_dtype)
+        if len(local_workers) > 0:
+            shared_future = loop.run_in_executor(SERDE_POOL, write_shared_params, model_params, shm_path, transport_dtype)
+        
+        fit_tasks = [
+            asyncio.ensure_future(fit_model_on_worker(
+                worker_ptr=worker,
+                params_future=params_future,
+                shared_future=shared_future,
+                cleanup_future=pending_cleanup.pop(worker.id, None),
+                param_count=model_params.numel(),
+                train_plan=train_plan,
+                dataset_key=glb.DATASET_ID,
+                iteration=curr_iter,
+                kwargs=kwargs,
+            ))
+            for worker in sampled_workers
+        ]
+        
+        # reduce the updates into a single running sum as soon as each worker reports back,
+        # so the server never holds more than one model worth of updates at a time
+        avgd_update = torch.zeros_like(model_params)
+        nr_updates = 0
+        for next_result in asyncio.as_completed(fit_tasks):
+            worker_id, loss, recvd_update = await next_result
+            # prepare the worker for the next iteration while the others are still training
+            pending_cleanup[worker_id] = loop.run_in_executor(SERDE_POOL, workers_by_id[worker_id].clear_objects_remote)
+            avgd_update.add_(recvd_update)
+            nr_updates += 1
         end_timer_iter = timer()
 
         print(f"Iteration: {curr_iter}\nTime to train and await gradients for {len(sampled_workers)} workers: {(end_timer_iter-start_timer_iter):3f}s")
-
         
-        # extract from all workers the updated model parameters
-        upd_wrkr = {}
-        for worker_id, loss, recvd_update in results:
-            upd_wrkr[worker_id] = recvd_update
+        # the validation of the previous iteration ran while the workers trained, make sure it
+        # is done before val_model is loaded with the new parameters
+        if val_future is not None:
+            val_loss, prec1 = await val_future
         
-        # get the parameter average
-        avgd_update = average_model_parameters(upd_wrkr)
+        # scale the summed up updates to get the parameter average
+        avgd_update *= (1.0 / nr_updates)
         
-        # unpack the new parameters into local model
+        # apply the update and unpack the new parameters into local model
         model_params.add_(avgd_update)
         model_unflatten(model, model_params)
         
-        # evaluate on testset using the new model
+        # evaluate on testset using a snapshot of the new model, in the background
         print("Begin Validation @ Iteration {}".format(curr_iter+1))
-        val_loss, prec1 = validate(test_loader, model, criterion)
+        model_unflatten(val_model, model_params)
+        val_future = loop.run_in_executor(None, validate, test_loader, val_model, criterion)
+    
+    # wait for the validation of the last iteration and the outstanding clean ups
+    if val_future is not None:
+        val_loss, prec1 = await val_future
+    await asyncio.gather(*pending_cleanup.values())
+    
+    # remove the shared memory file of this run
+    if shm_path is not None and os.path.exists(shm_path):
+        os.remove(shm_path)
         
-    #while True:
-    #   continue
     end = timer()
     print(f"Total Training Time for {n_iterations} iterations: {(end-start):3f} seconds")
+    # simply return here, run_forever() keeps the server alive for late joining workers
 
 #***********************************************************************************************#
 #                                                                                               #
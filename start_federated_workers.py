@@ -4,6 +4,7 @@
 #                                                                                               #
 #-----------------------------------------------------------------------------------------------#
 import sys
+import json
 import signal
 
 import subprocess
@@ -44,9 +45,7 @@ async def send_local_info(remote_host, remote_port, worker_list):
     # send information of each worker to the server
     for worker in worker_list:
         async with websockets.connect(uri) as websocket:
-            await websocket.send(worker[2])
-            await websocket.send(worker[0])
-            await websocket.send("{0}".format(worker[1]))
+            await websocket.send(json.dumps({"id": worker[2], "host": worker[0], "port": worker[1]}))
 
 #***********************************************************************************************#
 #                                                                                               #
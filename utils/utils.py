@@ -5,6 +5,7 @@
 #-----------------------------------------------------------------------------------------------#
 import torch
 import syft as sy
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
 
 #***********************************************************************************************#
 #                                                                                               #
@@ -13,17 +14,75 @@ import syft as sy
 #                                                                                               #
 #***********************************************************************************************#
 def model_flatten(model):
-    vec = []
-    for param in model.parameters():
-        vec.append(param.data.view(-1))
-    return torch.cat(vec)
+    return _flatten_dense_tensors([param.data for param in model.parameters()])
 
 def model_unflatten(model, vec):
-    pointer = 0
-    for param in model.parameters():
-        num_param = torch.prod(torch.LongTensor(list(param.size())))
-        param.data = vec[pointer:pointer + num_param].view(param.size())
-        pointer += num_param
+    params = list(model.parameters())
+    for param, new_data in zip(params, _unflatten_dense_tensors(vec, params)):
+        # copy into the parameter's own storage rather than aliasing a slice of vec, a
+        # slice would drag the whole flat buffer along whenever the parameter is serialized
+        param.data.copy_(new_data)
+        assert param.data.storage().size() == param.numel()
+
+#***********************************************************************************************#
+#                                                                                               #
+#   Description:                                                                                #
+#   compress and decompress the flattened parameters for transport between server and workers.  #
+#                                                                                               #
+#***********************************************************************************************#
+def pack_params(params, dtype=torch.float32):
+    """Cast the flattened parameters to a compact dtype for transport.
+    Args:
+        params: flattened model parameters (or updates).
+        dtype: the dtype to ship the parameters in.
+    Returns:
+        a dense copy of params in the requested dtype.
+    """
+    return params.detach().to(dtype, copy=True).contiguous()
+
+def pack_sparse_params(params, dtype=torch.float32):
+    """Cast the flattened parameters to a compact dtype for transport, keeping only the
+    non zero entries.
+    Args:
+        params: flattened model parameters (or updates).
+        dtype: the dtype to ship the values in.
+    Returns:
+        a sparse COO copy of params with values in the requested dtype.
+    """
+    indices = params.nonzero().t()
+    values = params[indices[0]].detach().to(dtype)
+    return torch.sparse_coo_tensor(indices, values, params.size())
+
+def unpack_params(params, dtype=torch.float32):
+    """Cast the received parameters back to the dtype used for training.
+    Args:
+        params: compressed parameters as produced by pack_params() or pack_sparse_params().
+        dtype: the dtype used for training.
+    Returns:
+        a dense copy of params in the requested dtype.
+    """
+    if params.is_sparse:
+        # upcast the values before densifying, half precision sparse ops are not available on cpu
+        params = torch.sparse_coo_tensor(params._indices(), params._values().to(dtype), params.size())
+        return params.to_dense()
+    return params.detach().to(dtype, copy=True)
+
+def mask_insignificant_changes(update, model, threshold):
+    """Zero out, in place, the entries of a flattened update that changed by less than
+    threshold times the standard deviation of the parameter tensor they belong to.
+    Args:
+        update: flattened change of the model parameters.
+        model: the model the update belongs to.
+        threshold: significance threshold relative to each parameter's standard deviation.
+    Returns:
+        the masked update.
+    """
+    params = list(model.parameters())
+    # the unflattened tensors are views into update, so masking them masks update itself
+    for param, param_update in zip(params, _unflatten_dense_tensors(update, params)):
+        scale = threshold * param.data.std().item() if param.numel() > 1 else 0.0
+        param_update.masked_fill_(param_update.abs() <= scale, 0.0)
+    return update
 
 #***********************************************************************************************#
 #                                                                                               #
@@ -32,17 +91,12 @@ def model_unflatten(model, vec):
 #                                                                                               #
 #***********************************************************************************************#
 def model_grad_flatten(model):
-    vec = []
-    for param in model.parameters():
-        vec.append(param.grad.view(-1))
-    return torch.cat(vec)
+    return _flatten_dense_tensors([param.grad for param in model.parameters()])
 
 def model_grad_unflatten(model, vec):
-    pointer = 0
-    for param in model.parameters():
-        num_param = torch.prod(torch.LongTensor(list(param.size())))
-        param.grad = vec[pointer:pointer + num_param].view(param.size())
-        pointer += num_param
+    params = list(model.parameters())
+    for param, new_grad in zip(params, _unflatten_dense_tensors(vec, params)):
+        param.grad = new_grad
         
 #***********************************************************************************************#
 #                                                                                               #
@@ -114,31 +168,3 @@ def scale_model_parameters(model_params, scale_factor):
 #***********************************************************************************************#
 def add_model_parameters(dst_model_params, src_model_params):
     pass
-
-#***********************************************************************************************#
-#                                                                                               #
-#   Description:                                                                                #
-#   utility function to average a dictionary of models.                                         #
-#                                                                                               #
-#***********************************************************************************************#
-def average_model_parameters(model_params: dict):
-    """Calculate the average of a dictionary containing model parameters.
-    Args:
-        models (Dict): a dictionary of model parameters for which the 
-        average is calculated.
-    Returns:
-        List: the list of averaged parameters.
-    """
-    nr_models = len(model_params)
-    model_list = list(model_params.values())
-    avg_model = model_list[0]
-    
-    # add all models
-    for i in range(1, nr_models):
-        avg_model += model_list[i]
-        
-    # scale the summed up models
-    avg_model *= (1.0 / nr_models)
-    
-    # returnt the averaged model
-    return avg_model
@@ -5,6 +5,7 @@
 #-----------------------------------------------------------------------------------------------#
 import torch
 import syft as sy
+import json
 from timeit import default_timer as timer
 
 from typing import Union
@@ -79,13 +80,23 @@ class FederatedWorker(WebsocketServerWorker):
                          key_path=key_path,
                         )
     
-    def set_train_config(self, **kwargs):
-        """Set the training configuration in to the trainconfig object
+    def set_train_config_raw(self, blob: str, **kwargs):
+        """Set the training configuration from a JSON encoded configuration dictionary
         Args:
-            **kwargs:
-                add arguments here
+            blob: the JSON encoded training configuration.
+            **kwargs: Unused.
+        """
+        self.train_manager.setup_configurations(json.loads(blob))
+        return "SUCCESS"
+
+    def load_shared_params(self, path: str, dtype: str, **kwargs):
+        """Load the model parameters written to shared memory by a server on the same host
+        Args:
+            path: the shared memory file holding the raw parameters.
+            dtype: name of the dtype the parameters were written in.
+            **kwargs: Unused.
         """
-        self.train_manager.setup_configurations(kwargs)
+        self.train_manager.load_shared_params(path, dtype)
         return "SUCCESS"
 
     def fit(self, dataset_key: str, iteration: int, device: str = "cpu", **kwargs):
@@ -6,6 +6,8 @@
 import torch
 import syft as sy
 
+import asyncio
+import json
 import binascii
 from typing import Union
 from typing import List
@@ -60,33 +62,73 @@ class FederatedWorkerPointer(WebsocketClientWorker):
             data=data,
             timeout=timeout,
         )
+        
+        # whether the remote worker already holds the training configuration, a worker that
+        # reconnects gets a new pointer and therefore receives the configuration again
+        self.train_config_sent = False
+
+    def send_bytes(self, bin_message: bytes):
+        """Forward an already serialized message to the remote worker. This lets the same
+        payload be serialized once and then shipped to many workers.
+        Args:
+            bin_message: a message serialized with sy.serde.serialize()
+        Returns:
+            the deserialized response of the remote worker.
+        """
+        return sy.serde.deserialize(self._send_msg(bin_message), worker=self)
 
-    async def set_train_config(self, **kwargs):
+    def load_shared_params(self, path: str, dtype: str):
+        """Make the remote worker load the model parameters from a shared memory file
+        written on this host, instead of receiving them over the websocket.
+        Args:
+            path: the shared memory file holding the raw parameters.
+            dtype: name of the dtype the parameters were written in.
+        """
+        return self._send_msg_and_deserialize("load_shared_params", return_ids=[sy.ID_PROVIDER.pop()], path=path, dtype=dtype)
+
+    def set_train_config(self, **kwargs):
         """Call the set_train_config() method on the remote worker (FederatedWorker instance).
         Args:
             **kwargs:
                 return_ids: List[str]
         """
+        return_ids = kwargs.pop("return_ids", None)
+        # encode the whole configuration into a single payload, JSON (rather than pickle) keeps
+        # the worker from executing anything it receives
+        blob = json.dumps(dict(kwargs))
+        return self.set_train_config_raw(blob, return_ids=return_ids)
+
+    def set_train_config_raw(self, blob: str, return_ids: List[str] = None):
+        """Send an already JSON encoded training configuration to the remote worker.
+        Args:
+            blob: the JSON encoded training configuration dictionary.
+            return_ids: List[str]
+        """
         # send the training configuration and get response
-        return_ids = kwargs["return_ids"] if "return_ids" in kwargs else [sy.ID_PROVIDER.pop()]
-        response = self._send_msg_and_deserialize("set_train_config", return_ids=return_ids, **kwargs)
+        return_ids = return_ids if return_ids is not None else [sy.ID_PROVIDER.pop()]
+        response = self._send_msg_and_deserialize("set_train_config_raw", return_ids=return_ids, blob=blob)
+        self.train_config_sent = True
         # return the reponse from the above call.
         return response
 
-    async def async_fit(self, dataset_key: str, iteration: int, device: str = "cpu", return_ids: List[int] = None):
+    async def async_fit(self, dataset_key: str, iteration: int, device: str = "cpu", return_ids: List[int] = None, executor=None):
         """Asynchronous call to fit function on the remote location.
         Args:
             dataset_key: Identifier of the dataset which shall be used for the training.
             return_ids: List of return ids.
+            executor: executor used to fetch and deserialize the results off the event loop,
+                the default executor of the loop is used if None.
         Returns:
             See return value of the FederatedWorker.fit() method.
         """
         if return_ids is None:
             return_ids = [sy.ID_PROVIDER.pop()]
 
+        loop = asyncio.get_event_loop()
+
         # Close the existing websocket connection in order to open a asynchronous connection
         # This code is not tested with secure connections (wss protocol).
-        self.close()
+        await loop.run_in_executor(executor, self.close)
         async with websockets.connect(self.url, timeout=self.timeout, max_size=None, ping_timeout=self.timeout) as websocket:
             message = self.create_worker_command_message(
                 command_name="fit", return_ids=return_ids, dataset_key=dataset_key, iteration=iteration, device=device
@@ -96,20 +138,23 @@ class FederatedWorkerPointer(WebsocketClientWorker):
             await websocket.send(str(binascii.hexlify(serialized_message)))
             await websocket.recv()  # returned value will be None, so don't care
 
-        # Reopen the standard connection
-        self.connect()
+        # Reopen the standard connection and retrieve the result without blocking the event loop.
+        # The result is a single packed object, so one request per worker is all that is needed
+        # and the workers' fetches run concurrently with each other.
+        await loop.run_in_executor(executor, self.connect)
+        return await loop.run_in_executor(executor, self._fetch_fit_results, return_ids)
 
+    def _fetch_fit_results(self, return_ids: List[int]):
+        """Request and deserialize the result stored by the fit() method on the remote worker.
+        Args:
+            return_ids: List of return ids.
+        Returns:
+            the deserialized result holding the parameter change followed by the losses.
+        """
         # Send an object request message to retrieve the result tensor of the fit() method
         msg = ObjectRequestMessage(return_ids[0], None, "")
         serialized_message = sy.serde.serialize(msg)
-        loss = self._send_msg(serialized_message)
-        
-        msg = ObjectRequestMessage(return_ids[1], None, "")
-        serialized_message = sy.serde.serialize(msg)
-        updated_params = self._send_msg(serialized_message)
+        result = self._send_msg(serialized_message)
         
         # Return the deserialized response.
-        return sy.serde.deserialize(loss), sy.serde.deserialize(updated_params)
-
-
-
+        return sy.serde.deserialize(result)